@@ -0,0 +1,337 @@
+#  Copyright 2018 Ocean Protocol Foundation
+#  SPDX-License-Identifier: Apache-2.0
+
+"""Throughput and latency benchmark for :class:`osmosis_azure_driver.data_plugin.Plugin`.
+
+By default the benchmark runs against an in-process :class:`~benchmarks.fake_storage.FakeStorageServer`,
+optionally with injected latency and bandwidth. Pass ``--blob-endpoint`` to run against an
+Azurite-compatible endpoint instead. Results are written as JSON so that two runs can be diffed with
+``--baseline``::
+
+    python -m benchmarks.bench_data_plugin --sizes 1KB,1MB,1GB --counts 1,1000 --output bench.json
+    python -m benchmarks.bench_data_plugin --output new.json --baseline bench.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from osmosis_azure_driver import __version__
+from osmosis_azure_driver.config import Config
+from osmosis_azure_driver.data_plugin import Plugin
+
+from benchmarks.fake_storage import FakeStorageServer
+
+OPERATIONS = ('upload', 'download', 'list', 'generate_url', 'delete')
+SERVICES = ('blob', 'file')
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+# The azure sdk refuses to use the file service with the Azurite account, so the fake server gets its own.
+ACCOUNT_NAME = 'osmosisbench'
+# Well-known Azurite development account.
+DEV_ACCOUNT_NAME = 'devstoreaccount1'
+DEV_ACCOUNT_KEY = 'Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=='
+# Keys of the report metadata describing the benchmark setup, which must match for two runs to be comparable.
+CONFIG_KEYS = ('latency_ms', 'bandwidth_mb_s', 'data', 'compression', 'endpoint')
+
+benchmark_result = namedtuple('BenchmarkResult', ['name', 'service', 'operation', 'size', 'count', 'ops_per_sec',
+                                                  'mb_per_sec', 'p50_ms', 'p99_ms', 'mean_ms'])
+
+
+class _StorageAccountKeys(object):
+    """Answers ``storage_accounts.list_keys`` like :class:`StorageManagementClient` without AAD."""
+
+    def __init__(self, key):
+        self.storage_accounts = self
+        self._keys = type('StorageAccountListKeysResult', (object,), {
+            'keys': [type('StorageAccountKey', (object,), {'value': key})]})
+
+    def list_keys(self, resource_group_name, account_name):
+        return self._keys
+
+
+class BenchmarkPlugin(Plugin):
+    """Data plugin that skips the AAD login and management plane, so that only storage calls are measured."""
+
+    def __init__(self, config, account_key):
+        self.logger = logging.getLogger('Plugin')
+        self.storage_client = _StorageAccountKeys(account_key)
+        self.config = Config(config)
+        self.resource_group_name = self.config.resource_group_name
+
+
+def parse_size(value):
+    """Parse a human readable size such as ``'512KB'`` or ``'1GB'`` into bytes."""
+    value = value.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * UNITS[unit])
+    return int(value)
+
+
+def format_size(size):
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return '{}{}'.format(size // UNITS[unit], unit)
+    return '{}B'.format(size)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(math.ceil(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Peak RSS of the whole process, which includes the in-process fake server."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def _csv_chunk(size):
+    lines = b''.join(b'%d,%d,osmosis-azure-driver,%f\n' % (i, i * 31 % 977, i / 7.0) for i in range(size // 20 + 1))
+    return lines[:size]
+
+
+def _write_source_file(path, size, data='random'):
+    """Write ``size`` bytes of incompressible (``'random'``) or CSV-like (``'csv'``) data."""
+    csv = _csv_chunk(1024 * 1024) if data == 'csv' else None
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            length = min(remaining, 1024 * 1024)
+            chunk = os.urandom(length) if csv is None else csv[:length]
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+def _summarize(service, operation, size, count, latencies, elapsed, transferred):
+    return benchmark_result(
+        name='{}.{}.{}x{}'.format(service, operation, format_size(size), count),
+        service=service,
+        operation=operation,
+        size=size,
+        count=count,
+        ops_per_sec=len(latencies) / elapsed if elapsed else 0.0,
+        mb_per_sec=transferred / elapsed / UNITS['MB'] if elapsed and transferred else 0.0,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        mean_ms=sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+    )
+
+
+def _timed(calls):
+    latencies = []
+    started = time.perf_counter()
+    for call in calls:
+        op_started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - op_started)
+    return latencies, time.perf_counter() - started
+
+
+def run_scenario(plugin, account, service, size, count, operations, workdir, list_iterations=10, data='random'):
+    """Run every operation in ``operations`` on ``count`` objects of ``size`` bytes and return the results."""
+    container = 'bench-{}-{}x{}'.format(service, format_size(size), count).lower()
+    key = plugin.storage_client.storage_accounts.list_keys(plugin.resource_group_name, account).keys[0].value
+    if service == 'blob':
+        storage = plugin._blob_service(account, key)
+        storage.create_container(container)
+    else:
+        storage = plugin._file_service(account, key)
+        storage.create_share(container)
+
+    source = os.path.join(workdir, 'source-{}-{}'.format(data, size))
+    if not os.path.exists(source):
+        _write_source_file(source, size, data)
+    target = os.path.join(workdir, 'target')
+    urls = ['https://{}.{}.core.windows.net/{}/object-{:06d}'.format(account, service, container, i)
+            for i in range(count)]
+
+    plans = {
+        'upload': ([lambda url=url: plugin.upload(source, url) for url in urls], size),
+        'download': ([lambda url=url: plugin.download(url, target) for url in urls], size),
+        'list': ([lambda: plugin.list(container, service == 'blob', account)] * list_iterations, 0),
+        'generate_url': ([lambda url=url: plugin.generate_url(url) for url in urls], 0),
+        'delete': ([lambda url=url: plugin.delete(url) for url in urls], 0),
+    }
+    results = []
+    try:
+        # Uploads always run first, the other operations need the objects to exist.
+        for operation in ('upload',) + tuple(op for op in OPERATIONS if op != 'upload'):
+            if operation != 'upload' and operation not in operations:
+                continue
+            calls, object_size = plans[operation]
+            latencies, elapsed = _timed(calls)
+            if operation in operations:
+                results.append(_summarize(service, operation, size, count, latencies, elapsed,
+                                          object_size * len(calls)))
+    finally:
+        if service == 'blob':
+            storage.delete_container(container)
+        else:
+            storage.delete_share(container)
+    return results
+
+
+def run(sizes, counts, services=SERVICES, operations=OPERATIONS, config=None, account=ACCOUNT_NAME,
+        account_key=DEV_ACCOUNT_KEY, max_bytes=4 * UNITS['GB'], list_iterations=10, data='random'):
+    """Run the benchmark matrix and return the list of :data:`benchmark_result`."""
+    plugin = BenchmarkPlugin(config, account_key)
+    workdir = tempfile.mkdtemp(prefix='bench-data-plugin-')
+    results = []
+    try:
+        for service in services:
+            for size in sizes:
+                for count in counts:
+                    if size * count > max_bytes:
+                        logging.info('Skipping %s %sx%s, above --max-bytes', service, format_size(size), count)
+                        continue
+                    logging.info('Running %s %sx%s', service, format_size(size), count)
+                    results.extend(run_scenario(plugin, account, service, size, count, operations, workdir,
+                                                list_iterations, data))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def to_json(results, **meta):
+    meta.update({
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        # ru_maxrss never decreases, so it is only meaningful once for the whole run.
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    return {'meta': meta, 'results': [r._asdict() for r in results]}
+
+
+def compare(current, baseline, threshold=10.0):
+    """Compare two JSON reports. Returns the lines to print and the names of the regressed benchmarks.
+
+    A benchmark regresses when its ops/s or MB/s drops or its p99 latency grows by more than ``threshold``
+    percent. The peak RSS of the run regresses when it grows by more than ``threshold`` percent. The runs are
+    still compared when their setup (:data:`CONFIG_KEYS` of the metadata) differs, but the differences are
+    reported first, since they make the deltas meaningless.
+    """
+    previous = {r['name']: r for r in baseline['results']}
+    lines, regressions = [], []
+    for key in CONFIG_KEYS:
+        value, old_value = current['meta'].get(key), baseline['meta'].get(key)
+        if value != old_value:
+            logging.warning('The runs differ in %s: %s in the baseline, %s now', key, old_value, value)
+            lines.append('WARNING: {} differs, baseline {!r}, current {!r}'.format(key, old_value, value))
+    for result in current['results']:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+        ops_delta = _delta(result['ops_per_sec'], old['ops_per_sec'])
+        mb_delta = _delta(result['mb_per_sec'], old['mb_per_sec'])
+        p99_delta = _delta(result['p99_ms'], old['p99_ms'])
+        regressed = ops_delta < -threshold or mb_delta < -threshold or p99_delta > threshold
+        if regressed:
+            regressions.append(result['name'])
+        lines.append('{:<40} ops/s {:>+8.1f}%  MB/s {:>+8.1f}%  p99 {:>+8.1f}%{}'.format(
+            result['name'], ops_delta, mb_delta, p99_delta, '  REGRESSION' if regressed else ''))
+    rss, old_rss = current['meta'].get('peak_rss_mb'), baseline['meta'].get('peak_rss_mb')
+    if rss is not None and old_rss is not None:
+        rss_delta = _delta(rss, old_rss)
+        regressed = rss_delta > threshold
+        if regressed:
+            regressions.append('peak_rss_mb')
+        lines.append('{:<40} RSS   {:>+8.1f}%{}'.format('peak_rss_mb', rss_delta, '  REGRESSION' if regressed else ''))
+    return lines, regressions
+
+
+def _delta(new, old):
+    return (new - old) / old * 100.0 if old else 0.0
+
+
+def _print_table(results):
+    print('{:<40} {:>10} {:>10} {:>10} {:>10}'.format('benchmark', 'ops/s', 'MB/s', 'p50 ms', 'p99 ms'))
+    for r in results:
+        print('{:<40} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+            r.name, r.ops_per_sec, r.mb_per_sec, r.p50_ms, r.p99_ms))
+    print('peak RSS of the run: {:.1f} MB'.format(peak_rss_mb()))
+
+
+def _csv(value, parse=str):
+    return [parse(v) for v in value.split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1KB,1MB,16MB', help='object sizes, e.g. 1KB,1MB,1GB')
+    parser.add_argument('--counts', default='1,100', help='object counts, e.g. 1,1000,100000')
+    parser.add_argument('--services', default=','.join(SERVICES), help='blob and/or file')
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help='operations to report')
+    parser.add_argument('--max-bytes', default='4GB', help='skip scenarios moving more than this per operation')
+    parser.add_argument('--list-iterations', type=int, default=10, help='list calls per scenario')
+    parser.add_argument('--data', default='random', choices=('random', 'csv'), help='content of the files')
+    parser.add_argument('--compression', choices=('gzip', 'zstd'), help='compress the uploads with this codec')
+    parser.add_argument('--latency', type=float, default=0.0, help='injected latency per request in ms')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bandwidth per connection in MB/s')
+    parser.add_argument('--blob-endpoint', help='Azurite-compatible blob endpoint instead of the fake server')
+    parser.add_argument('--file-endpoint', help='file endpoint to use with --blob-endpoint')
+    parser.add_argument('--account', help='storage account, {} with --blob-endpoint'.format(DEV_ACCOUNT_NAME))
+    parser.add_argument('--key', default=DEV_ACCOUNT_KEY)
+    parser.add_argument('--output', help='write the JSON report to this path')
+    parser.add_argument('--baseline', help='JSON report of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('azure').setLevel(logging.WARNING)
+
+    services = _csv(args.services)
+    options = dict(sizes=_csv(args.sizes, parse_size), counts=_csv(args.counts, int), services=services,
+                   operations=_csv(args.operations), account=args.account or ACCOUNT_NAME, account_key=args.key,
+                   max_bytes=parse_size(args.max_bytes), list_iterations=args.list_iterations, data=args.data)
+    meta = {'latency_ms': args.latency, 'bandwidth_mb_s': args.bandwidth, 'data': args.data,
+            'compression': args.compression}
+    if args.blob_endpoint:
+        if not args.file_endpoint and 'file' in services:
+            # Azurite does not emulate the file service.
+            logging.info('No --file-endpoint given, skipping the file service')
+            options['services'] = [s for s in services if s != 'file']
+        options['account'] = args.account or DEV_ACCOUNT_NAME
+        meta['endpoint'] = args.blob_endpoint
+        results = run(config={'azure.blob.endpoint': args.blob_endpoint,
+                              'azure.file.endpoint': args.file_endpoint,
+                              'azure.compression': args.compression}, **options)
+    else:
+        meta['endpoint'] = 'in-process'
+        bandwidth = args.bandwidth * UNITS['MB'] if args.bandwidth else None
+        with FakeStorageServer(latency=args.latency / 1000.0, bandwidth=bandwidth) as server:
+            results = run(config={'azure.blob.endpoint': server.blob_endpoint,
+                                  'azure.file.endpoint': server.file_endpoint,
+                                  'azure.compression': args.compression}, **options)
+
+    _print_table(results)
+    report = to_json(results, **meta)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressions = compare(report, json.load(f), args.threshold)
+        print('\n'.join(lines))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
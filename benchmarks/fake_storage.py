@@ -0,0 +1,431 @@
+#  Copyright 2018 Ocean Protocol Foundation
+#  SPDX-License-Identifier: Apache-2.0
+
+"""In-process stand-in for the Azure Blob and File REST endpoints used by the data plugin.
+
+Only the subset of the API exercised by :class:`osmosis_azure_driver.data_plugin.Plugin` is implemented,
+using path-style urls (``http://127.0.0.1:<port>/<account>/<container>/<blob>``) like Azurite does.
+Requests are not authenticated. Objects are kept on disk so that GB sized files do not inflate the RSS
+of the benchmark process.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+from xml.etree import ElementTree as ETree
+from xml.sax.saxutils import escape
+
+CHUNK_SIZE = 64 * 1024
+LIST_PAGE_SIZE = 5000
+PROPERTIES_SUFFIX = '.props'
+
+
+class Throttle(object):
+    """Injects a fixed latency per request and caps the per-connection transfer rate."""
+
+    def __init__(self, latency=0.0, bandwidth=None):
+        """
+        :param latency: seconds to wait before answering each request.
+        :param bandwidth: bytes per second per connection, None for unlimited.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def transfer(self, nbytes, started):
+        """Sleep until ``nbytes`` could have been transferred since ``started`` at the configured rate."""
+        if self.bandwidth:
+            remaining = started + float(nbytes) / self.bandwidth - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeAzureStorage/0.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # Helpers
+
+    def _parse(self):
+        url = urlparse(self.path)
+        self.query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        # parts = [account, container_or_share, *path]
+        self.account = parts[0] if parts else None
+        self.container = parts[1] if len(parts) > 1 else None
+        self.names = parts[2:]
+
+    def _container_dir(self):
+        return os.path.join(self.server.root, quote(self.account, safe=''), quote(self.container, safe=''))
+
+    def _object_path(self, names=None):
+        names = self.names if names is None else names
+        return os.path.join(self._container_dir(), *[quote(n, safe='') for n in names])
+
+    def _read_body(self, sink=None):
+        length = int(self.headers.get('Content-Length') or 0)
+        started = time.perf_counter()
+        received = 0
+        body = [] if sink is None else None
+        while received < length:
+            chunk = self.rfile.read(min(CHUNK_SIZE, length - received))
+            if not chunk:
+                break
+            received += len(chunk)
+            self.server.throttle.transfer(received, started)
+            if sink is None:
+                body.append(chunk)
+            else:
+                sink.write(chunk)
+        return b''.join(body) if sink is None else received
+
+    def _send(self, status, body=b'', headers=None, source=None, length=None):
+        self.send_response(status)
+        self.send_header('x-ms-request-id', str(threading.get_ident()))
+        self.send_header('x-ms-version', self.headers.get('x-ms-version', ''))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(length if source is not None else len(body)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        if source is None:
+            self.wfile.write(body)
+            return
+        started = time.perf_counter()
+        sent = 0
+        while sent < length:
+            chunk = source.read(min(CHUNK_SIZE, length - sent))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            self.server.throttle.transfer(sent, started)
+
+    def _error(self, status, code):
+        body = ('<?xml version="1.0" encoding="utf-8"?><Error><Code>{}</Code>'
+                '<Message>{}</Message></Error>').format(code, code).encode('utf-8')
+        self._send(status, body, {'Content-Type': 'application/xml', 'x-ms-error-code': code})
+
+    def _object_headers(self, path):
+        stat = os.stat(path)
+        return {
+            'ETag': '"0x{:X}"'.format(int(stat.st_mtime * 1e6)),
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        }
+
+    def _save_properties(self, path, content_encoding_header):
+        """Keep the content encoding and metadata of an object in a ``.props`` file next to it."""
+        properties = {
+            'content_encoding': self.headers.get(content_encoding_header),
+            'metadata': {k[len('x-ms-meta-'):]: v for k, v in self.headers.items()
+                         if k.lower().startswith('x-ms-meta-')},
+        }
+        with open(path + PROPERTIES_SUFFIX, 'w') as f:
+            json.dump(properties, f)
+
+    def _load_properties(self, path):
+        try:
+            with open(path + PROPERTIES_SUFFIX) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'content_encoding': None, 'metadata': {}}
+
+    def _list_names(self, path):
+        return sorted(unquote(n) for n in os.listdir(path) if not n.endswith(('.block', PROPERTIES_SUFFIX)))
+
+    def _dispatch(self, handlers):
+        self._parse()
+        self.server.throttle.wait()
+        handler = handlers.get(self.query.get('comp') or self.query.get('restype'))
+        if self.account is None or self.container is None or handler is None:
+            self._read_body()
+            return self._error(400, 'InvalidUri')
+        try:
+            handler()
+        except FileNotFoundError:
+            self._error(404, 'ResourceNotFound')
+
+    # HTTP verbs
+
+    def do_PUT(self):
+        if self.server.service == 'blob':
+            self._dispatch({'container': self._create_container,
+                            'block': self._put_block,
+                            'blocklist': self._put_block_list,
+                            None: self._put_blob})
+        else:
+            self._dispatch({'share': self._create_container,
+                            'directory': self._create_directory,
+                            'range': self._put_range,
+                            'properties': self._set_file_properties,
+                            None: self._create_file})
+
+    def do_GET(self):
+        if self.server.service == 'blob':
+            self._dispatch({'list': self._list_blobs, None: self._get_object})
+        else:
+            self._dispatch({'list': self._list_directory, None: self._get_object})
+
+    def do_HEAD(self):
+        self._dispatch({None: self._get_object})
+
+    def do_DELETE(self):
+        self._dispatch({'container': self._delete_container,
+                        'share': self._delete_container,
+                        None: self._delete_object})
+
+    # Containers, shares and directories
+
+    def _create_container(self):
+        self._read_body()
+        path = self._container_dir()
+        if os.path.isdir(path):
+            return self._error(409, 'ContainerAlreadyExists')
+        os.makedirs(path)
+        self._send(201, headers=self._object_headers(path))
+
+    def _delete_container(self):
+        self._read_body()
+        shutil.rmtree(self._container_dir())
+        self._send(202)
+
+    def _create_directory(self):
+        self._read_body()
+        path = self._object_path()
+        if os.path.isdir(path):
+            return self._error(409, 'ResourceAlreadyExists')
+        os.makedirs(path)
+        self._send(201, headers=self._object_headers(path))
+
+    # Blob service
+
+    def _put_blob(self):
+        if not os.path.isdir(self._container_dir()):
+            self._read_body()
+            return self._error(404, 'ContainerNotFound')
+        path = self._object_path()
+        with open(path, 'wb') as f:
+            self._read_body(f)
+        self._save_properties(path, 'x-ms-blob-content-encoding')
+        self._send(201, headers=self._object_headers(path))
+
+    def _block_path(self):
+        block_id = hashlib.sha1(self.query['blockid'].encode('utf-8')).hexdigest()
+        return '{}.{}.block'.format(self._object_path(), block_id)
+
+    def _put_block(self):
+        with open(self._block_path(), 'wb') as f:
+            self._read_body(f)
+        self._send(201)
+
+    def _put_block_list(self):
+        block_list = ETree.fromstring(self._read_body())
+        path = self._object_path()
+        block_paths = []
+        with open(path, 'wb') as f:
+            for element in block_list:
+                self.query['blockid'] = element.text
+                block_paths.append(self._block_path())
+                with open(block_paths[-1], 'rb') as block:
+                    shutil.copyfileobj(block, f, CHUNK_SIZE)
+        for block_path in block_paths:
+            os.remove(block_path)
+        self._save_properties(path, 'x-ms-blob-content-encoding')
+        self._send(201, headers=self._object_headers(path))
+
+    def _list_blobs(self):
+        self._read_body()
+        names = self._list_names(self._container_dir())
+        entries, next_marker = self._page(names)
+        blobs = ''.join('<Blob><Name>{}</Name><Properties><Content-Length>{}</Content-Length>'
+                        '<BlobType>BlockBlob</BlobType></Properties></Blob>'
+                        .format(escape(n), os.path.getsize(self._object_path([n]))) for n in entries)
+        self._send_list('<Blobs>{}</Blobs>'.format(blobs), next_marker)
+
+    # File service
+
+    def _create_file(self):
+        self._read_body()
+        path = self._object_path()
+        with open(path, 'wb') as f:
+            f.truncate(int(self.headers.get('x-ms-content-length', 0)))
+        self._save_properties(path, 'x-ms-content-encoding')
+        self._send(201, headers=self._object_headers(path))
+
+    def _set_file_properties(self):
+        self._read_body()
+        path = self._object_path()
+        if self.headers.get('x-ms-content-length') is not None:
+            with open(path, 'r+b') as f:
+                f.truncate(int(self.headers['x-ms-content-length']))
+        # Like Azure, the content headers missing from the request are cleared.
+        properties = self._load_properties(path)
+        properties['content_encoding'] = self.headers.get('x-ms-content-encoding')
+        with open(path + PROPERTIES_SUFFIX, 'w') as f:
+            json.dump(properties, f)
+        self._send(200, headers=self._object_headers(path))
+
+    def _put_range(self):
+        start, end = self._range()
+        path = self._object_path()
+        with open(path, 'r+b') as f:
+            f.seek(start)
+            if self.headers.get('x-ms-write') == 'clear':
+                self._read_body()
+                f.write(b'\0' * (end - start + 1))
+            else:
+                self._read_body(f)
+        self._send(201, headers=self._object_headers(path))
+
+    def _list_directory(self):
+        self._read_body()
+        path = self._object_path()
+        names = self._list_names(path)
+        entries, next_marker = self._page(names)
+        files, directories = [], []
+        for name in entries:
+            full_path = os.path.join(path, quote(name, safe=''))
+            if os.path.isdir(full_path):
+                directories.append('<Directory><Name>{}</Name></Directory>'.format(escape(name)))
+            else:
+                files.append('<File><Name>{}</Name><Properties><Content-Length>{}</Content-Length>'
+                             '</Properties></File>'.format(escape(name), os.path.getsize(full_path)))
+        self._send_list('<Entries>{}{}</Entries>'.format(''.join(files), ''.join(directories)), next_marker)
+
+    # Shared by both services
+
+    def _range(self):
+        value = self.headers.get('x-ms-range') or self.headers.get('Range')
+        if not value:
+            return None, None
+        start, end = value.split('=', 1)[1].split('-', 1)
+        return int(start), int(end) if end else None
+
+    def _get_object(self):
+        self._read_body()
+        path = self._object_path()
+        if not os.path.isfile(path):
+            return self._error(404, 'BlobNotFound' if self.server.service == 'blob' else 'ResourceNotFound')
+        size = os.path.getsize(path)
+        headers = self._object_headers(path)
+        if self.headers.get('If-Match') not in (None, '*', headers['ETag']):
+            return self._error(412, 'ConditionNotMet')
+        headers['Content-Type'] = 'application/octet-stream'
+        if self.server.service == 'blob':
+            headers['x-ms-blob-type'] = 'BlockBlob'
+        properties = self._load_properties(path)
+        if properties['content_encoding']:
+            headers['Content-Encoding'] = properties['content_encoding']
+        for name, value in properties['metadata'].items():
+            headers['x-ms-meta-' + name] = value
+        start, end = self._range()
+        if start is None:
+            with open(path, 'rb') as f:
+                return self._send(200, headers=headers, source=f, length=size)
+        if start >= size:
+            return self._error(416, 'InvalidRange')
+        end = size - 1 if end is None else min(end, size - 1)
+        headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            self._send(206, headers=headers, source=f, length=end - start + 1)
+
+    def _delete_object(self):
+        self._read_body()
+        path = self._object_path()
+        os.remove(path)
+        if os.path.exists(path + PROPERTIES_SUFFIX):
+            os.remove(path + PROPERTIES_SUFFIX)
+        self._send(202)
+
+    def _page(self, names):
+        marker = self.query.get('marker')
+        max_results = int(self.query.get('maxresults', LIST_PAGE_SIZE))
+        if marker:
+            names = [n for n in names if n >= marker]
+        entries = names[:max_results]
+        next_marker = names[max_results] if len(names) > max_results else ''
+        return entries, next_marker
+
+    def _send_list(self, entries, next_marker):
+        body = ('<?xml version="1.0" encoding="utf-8"?><EnumerationResults>{}<NextMarker>{}</NextMarker>'
+                '</EnumerationResults>').format(entries, escape(next_marker)).encode('utf-8')
+        self._send(200, body, {'Content-Type': 'application/xml'})
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeStorageServer(object):
+    """Serves fake Blob and File endpoints on two local ports.
+
+    Usage::
+
+        with FakeStorageServer(latency=0.005, bandwidth=100 * 1024 * 1024) as server:
+            config = {'azure.blob.endpoint': server.blob_endpoint,
+                      'azure.file.endpoint': server.file_endpoint}
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, root=None, host='127.0.0.1'):
+        self.throttle = Throttle(latency, bandwidth)
+        self._own_root = root is None
+        self.root = tempfile.mkdtemp(prefix='fake-azure-storage-') if root is None else root
+        self._servers = {}
+        self._threads = []
+        for service in ('blob', 'file'):
+            server = _Server((host, 0), _Handler)
+            server.service = service
+            server.root = os.path.join(self.root, service)
+            server.throttle = self.throttle
+            os.makedirs(server.root, exist_ok=True)
+            self._servers[service] = server
+
+    @property
+    def blob_endpoint(self):
+        return self._endpoint('blob')
+
+    @property
+    def file_endpoint(self):
+        return self._endpoint('file')
+
+    def _endpoint(self, service):
+        host, port = self._servers[service].server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        for server in self._servers.values():
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self._own_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
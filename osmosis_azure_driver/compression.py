@@ -0,0 +1,176 @@
+#  Copyright 2018 Ocean Protocol Foundation
+#  SPDX-License-Identifier: Apache-2.0
+
+"""Streaming compression of uploads and decompression of downloads.
+
+Data is compressed in independent frames of :data:`FRAME_SIZE` bytes, in parallel, and the frames are
+concatenated. Both gzip (multi-member files) and zstd (multi-frame files) define such a concatenation as a valid
+stream, so the result can be read by any standard decompressor.
+"""
+
+import os
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the independent frames compressed in parallel.
+FRAME_SIZE = 1024 * 1024
+# Name of the metadata holding the uncompressed size of an object.
+ORIGINAL_SIZE_METADATA = 'osmosis_original_size'
+
+
+class GzipCodec(object):
+    name = 'gzip'
+    # Exception raised on corrupted data.
+    error = zlib.error
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompressobj(self):
+        return zlib.decompressobj(31)
+
+
+class ZstdCodec(object):
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression needs the zstandard package, install osmosis-azure-driver[zstd].")
+        self.level = level
+        self.error = zstandard.ZstdError
+        self._zstandard = zstandard
+        # Compression contexts can not be shared between threads.
+        self._local = threading.local()
+
+    def compress(self, data):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = self._local.compressor = self._zstandard.ZstdCompressor(level=self.level)
+        return compressor.compress(data)
+
+    def decompressobj(self):
+        return self._zstandard.ZstdDecompressor().decompressobj()
+
+
+CODECS = {
+    GzipCodec.name: GzipCodec,
+    ZstdCodec.name: ZstdCodec,
+}
+
+
+def get_codec(name):
+    """Return the codec called ``name``, or None if ``name`` is empty."""
+    if not name:
+        return None
+    if name not in CODECS:
+        raise ValueError("This compression is not valid. It should be one of {}.".format(', '.join(sorted(CODECS))))
+    return CODECS[name]()
+
+
+def compressed_size_bound(size, frame_size=FRAME_SIZE):
+    """Upper bound of the compressed size of ``size`` bytes, for both codecs."""
+    frames = max(1, -(-size // frame_size))
+    return size + size // 128 + 128 * frames
+
+
+def compress_frames(stream, codec, frame_size=FRAME_SIZE, workers=None):
+    """Read ``stream`` and yield its compressed frames in order, compressing up to ``workers`` frames at once.
+
+    At most ``2 * workers`` frames are held in memory.
+    """
+    workers = workers or min(os.cpu_count() or 1, 8)
+    pending = deque()
+    eof = False
+    empty = True
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            while not eof and len(pending) < 2 * workers:
+                data = stream.read(frame_size)
+                if not data:
+                    eof = True
+                    break
+                empty = False
+                pending.append(pool.submit(codec.compress, data))
+            if not pending:
+                break
+            yield pending.popleft().result()
+    if empty:
+        # An empty input still gives a valid compressed stream.
+        yield codec.compress(b'')
+
+
+class CompressingReader(object):
+    """Read-only, non-seekable file-like object returning the compressed content of ``stream``."""
+
+    def __init__(self, stream, codec, frame_size=FRAME_SIZE, workers=None):
+        self._frames = compress_frames(stream, codec, frame_size, workers)
+        self._buffer = bytearray()
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            frame = next(self._frames, None)
+            if frame is None:
+                break
+            self._buffer += frame
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._position += len(data)
+        return data
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._frames.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FrameDecompressor(object):
+    """Incremental decompressor accepting a concatenation of frames."""
+
+    def __init__(self, codec):
+        self._codec = codec
+        self._decompressor = codec.decompressobj()
+
+    def decompress(self, data):
+        output = []
+        while data:
+            output.append(self._decompressor.decompress(data))
+            if not self._decompressor.eof:
+                break
+            data = self._decompressor.unused_data
+            self._decompressor = self._codec.decompressobj()
+        return b''.join(output)
+
+
+def decompress_chunks(chunks, codec, output):
+    """Decompress an iterable of compressed chunks into the ``output`` file and return the written size."""
+    decompressor = FrameDecompressor(codec)
+    written = 0
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        output.write(data)
+        written += len(data)
+    return written
@@ -2,11 +2,10 @@
 #  SPDX-License-Identifier: Apache-2.0
 
 import logging
-import os
 import time
 
 from azure.common.cloud import get_cli_active_cloud
-from azure.common.credentials import get_azure_cli_credentials, ServicePrincipalCredentials
+from azure.common.credentials import get_azure_cli_credentials
 from azure.mgmt.containerinstance import ContainerInstanceManagementClient
 from azure.mgmt.containerinstance.models import (ContainerGroup, Container, ResourceRequirements,
                                                  ResourceRequests,
@@ -17,6 +16,8 @@ from azure.mgmt.resource import ResourceManagementClient
 from osmosis_driver_interface.computing_plugin import AbstractPlugin
 from osmosis_driver_interface.exceptions import OsmosisError
 
+from osmosis_azure_driver.session import get_credentials, get_session
+
 
 class Plugin(AbstractPlugin):
 
@@ -27,11 +28,10 @@ class Plugin(AbstractPlugin):
         logging.basicConfig(level=logging.INFO)
         try:
 
-            subscription_id = os.environ.get('AZURE_SUBSCRIPTION_ID')
-            credentials = self._login_azure_app_token()
-            # Create a Resource Management client
-            self.resource_client = ResourceManagementClient(credentials, subscription_id)
-            self.client = ContainerInstanceManagementClient(credentials, subscription_id)
+            # Credentials and clients are shared by all the plugins of the process
+            session = get_session()
+            self.resource_client = session.client(ResourceManagementClient)
+            self.client = session.client(ContainerInstanceManagementClient)
         except Exception:
             logging.error('Credentials were not valid or were not found.')
             raise OsmosisError
@@ -43,17 +43,9 @@ class Plugin(AbstractPlugin):
         """
         Authenticate APP using token credentials:
         https://docs.microsoft.com/en-us/python/azure/python-sdk-azure-authenticate?view=azure-python
-        :return: ~ServicePrincipalCredentials credentials
+        :return: ~osmosis_azure_driver.session.SharedCredentials credentials
         """
-        client_id = os.getenv('AZURE_CLIENT_ID') if not client_id else client_id
-        client_secret = os.getenv('AZURE_CLIENT_SECRET') if not client_secret else client_secret
-        tenant_id = os.getenv('AZURE_TENANT_ID') if not tenant_id else tenant_id
-        credentials = ServicePrincipalCredentials(
-            client_id=client_id,
-            secret=client_secret,
-            tenant=tenant_id,
-        )
-        return credentials
+        return get_credentials(client_id, client_secret, tenant_id)
 
     def _login_azure_cli(self):
         """
@@ -12,3 +12,18 @@ class Config(object):
             self.resource_group_name = config['azure.resource_group']
         else:
             self.resource_group_name = 'OceanProtocol'
+
+        # Optional base urls (e.g. http://127.0.0.1:10000) of an Azurite-compatible emulator.
+        # When set, the data plane requests go to <endpoint>/<account> instead of core.windows.net.
+        self.blob_endpoint = self._get_value(config, 'AZURE_BLOB_ENDPOINT', 'azure.blob.endpoint')
+        self.file_endpoint = self._get_value(config, 'AZURE_FILE_ENDPOINT', 'azure.file.endpoint')
+        # Optional codec ('gzip' or 'zstd') used to compress the uploads.
+        self.compression = self._get_value(config, 'AZURE_COMPRESSION', 'azure.compression')
+
+    @staticmethod
+    def _get_value(config, env_key, config_key):
+        if os.getenv(env_key) is not None:
+            return os.getenv(env_key)
+        elif config is not None and config_key in config:
+            return config[config_key]
+        return None
@@ -3,18 +3,36 @@
 
 import os
 import logging
+import time
+import uuid
 from datetime import datetime, timedelta
+from functools import partial
+import requests
+import urllib3
+from azure.common import AzureHttpError
 from azure.storage.blob import BlobPermissions
 from azure.storage.blob import BlockBlobService
+from azure.storage.blob import ContentSettings as BlobContentSettings
 from azure.storage.file import FileService
+from azure.storage.file import ContentSettings as FileContentSettings
 from azure.common.cloud import get_cli_active_cloud
 from azure.mgmt.storage import StorageManagementClient
 from azure.mgmt.resource import ResourceManagementClient
-from azure.common.credentials import get_azure_cli_credentials, ServicePrincipalCredentials
+from azure.common.credentials import get_azure_cli_credentials
 from osmosis_driver_interface.exceptions import OsmosisError
 from osmosis_driver_interface.data_plugin import AbstractPlugin
 from osmosis_azure_driver.utils import _parse_url
 from osmosis_azure_driver.config import Config
+from osmosis_azure_driver.session import get_credentials, get_session
+from osmosis_azure_driver.compression import (ORIGINAL_SIZE_METADATA, CompressingReader, compress_frames,
+                                              compressed_size_bound, decompress_chunks, get_codec)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Connect and read timeouts, in seconds, of the compressed downloads.
+DOWNLOAD_TIMEOUT = (20, 60)
+# Attempts of a compressed download failing with a connection error or a server error.
+DOWNLOAD_ATTEMPTS = 3
+
 
 class Plugin(AbstractPlugin):
 
@@ -25,11 +43,10 @@ class Plugin(AbstractPlugin):
         logging.basicConfig(level=logging.INFO)
         try:
 
-            subscription_id = os.environ.get('AZURE_SUBSCRIPTION_ID')
-            credentials = self._login_azure_app_token()
-            # Create a Resource Management client
-            self.resource_client = ResourceManagementClient(credentials, subscription_id)
-            self.storage_client = StorageManagementClient(credentials, subscription_id)
+            # Credentials and clients are shared by all the plugins of the process
+            session = get_session()
+            self.resource_client = session.client(ResourceManagementClient)
+            self.storage_client = session.client(StorageManagementClient)
         except Exception:
             logging.error('Credentials were not valid or were not found.')
             raise OsmosisError
@@ -42,17 +59,9 @@ class Plugin(AbstractPlugin):
         """
         Authenticate APP using token credentials:
         https://docs.microsoft.com/en-us/python/azure/python-sdk-azure-authenticate?view=azure-python
-        :return: ~ServicePrincipalCredentials credentials
+        :return: ~osmosis_azure_driver.session.SharedCredentials credentials
         """
-        client_id = os.getenv('AZURE_CLIENT_ID') if not client_id else client_id
-        client_secret = os.getenv('AZURE_CLIENT_SECRET') if not client_secret else client_secret
-        tenant_id = os.getenv('AZURE_TENANT_ID') if not tenant_id else tenant_id
-        credentials = ServicePrincipalCredentials(
-            client_id=client_id,
-            secret=client_secret,
-            tenant=tenant_id,
-        )
-        return credentials
+        return get_credentials(client_id, client_secret, tenant_id)
 
     def _login_azure_cli(self):
         """
@@ -66,6 +75,25 @@ class Plugin(AbstractPlugin):
         """str: the type of this plugin (``'Azure'``)"""
         return "Azure"
 
+    def _blob_service(self, account, key):
+        """Build a :class:`BlockBlobService`, pointing to the configured blob endpoint if any."""
+        if self.config.blob_endpoint:
+            return BlockBlobService(
+                connection_string=self._connection_string('BlobEndpoint', self.config.blob_endpoint, account, key))
+        return BlockBlobService(account_name=account, account_key=key)
+
+    def _file_service(self, account, key):
+        """Build a :class:`FileService`, pointing to the configured file endpoint if any."""
+        if self.config.file_endpoint:
+            return FileService(
+                connection_string=self._connection_string('FileEndpoint', self.config.file_endpoint, account, key))
+        return FileService(account_name=account, account_key=key)
+
+    @staticmethod
+    def _connection_string(endpoint_name, endpoint, account, key):
+        return 'AccountName={};AccountKey={};{}={}/{}'.format(account, key, endpoint_name, endpoint.rstrip('/'),
+                                                               account)
+
     def upload(self, local_file, remote_file):
         """Upload file to the cloud. The azure url format is https://myaccount.blob.core.windows.net/mycontainer/myblob.
          Args:
@@ -95,13 +123,13 @@ class Plugin(AbstractPlugin):
         """
         key = self.storage_client.storage_accounts.list_keys(self.resource_group_name, account).keys[0].value
         if container:
-            bs = BlockBlobService(account_name=account, account_key=key)
+            bs = self._blob_service(account, key)
             container_list = []
             for i in bs.list_blobs(container_or_share_name).items:
                 container_list.append(i.name)
             return container_list
         elif not container:
-            fs = FileService(account_name=account, account_key=key)
+            fs = self._file_service(account, key)
             container_list = []
             for i in fs.list_directories_and_files(container_or_share_name).items:
                 container_list.append(i.name)
@@ -116,25 +144,28 @@ class Plugin(AbstractPlugin):
         """
         parse_url = _parse_url(remote_file)
         key = self.storage_client.storage_accounts.list_keys(self.resource_group_name, parse_url.account).keys[0].value
+        return self._sign_url(parse_url, key, timedelta(hours=24))
+
+    def _sign_url(self, parse_url, key, expires_in):
         if parse_url.file_type == 'blob':
-            bs = BlockBlobService(account_name=parse_url.account, account_key=key)
+            bs = self._blob_service(parse_url.account, key)
 
             sas_token = bs.generate_blob_shared_access_signature(parse_url.container_or_share_name,
                                                                  parse_url.file,
                                                                  permission=BlobPermissions.READ,
-                                                                 expiry=datetime.utcnow() + timedelta(hours=24),
+                                                                 expiry=datetime.utcnow() + expires_in,
                                                                  )
             source_blob_url = bs.make_blob_url(container_name=parse_url.container_or_share_name,
                                                blob_name=parse_url.file,
                                                sas_token=sas_token)
             return source_blob_url
         elif parse_url.file_type == 'file':
-            fs = FileService(account_name=parse_url.account, account_key=key)
+            fs = self._file_service(parse_url.account, key)
             sas_token = fs.generate_file_shared_access_signature(share_name=parse_url.container_or_share_name,
                                                                  directory_name=parse_url.path,
                                                                  file_name=parse_url.file,
                                                                  permission=BlobPermissions.READ,
-                                                                 expiry=datetime.utcnow() + timedelta(hours=24),
+                                                                 expiry=datetime.utcnow() + expires_in,
                                                                  )
             source_file_url = fs.make_file_url(share_name=parse_url.container_or_share_name,
                                                directory_name=parse_url.path,
@@ -158,10 +189,10 @@ class Plugin(AbstractPlugin):
         parse_url = _parse_url(remote_file)
         key = self.storage_client.storage_accounts.list_keys(self.resource_group_name, parse_url.account).keys[0].value
         if parse_url.file_type == 'blob':
-            bs = BlockBlobService(account_name=parse_url.account, account_key=key)
+            bs = self._blob_service(parse_url.account, key)
             return bs.delete_blob(parse_url.container_or_share_name, parse_url.file)
         elif parse_url.file_type == 'file':
-            fs = FileService(account_name=parse_url.account, account_key=key)
+            fs = self._file_service(parse_url.account, key)
             return fs.delete_file(parse_url.container_or_share_name, parse_url.path, parse_url.file)
         else:
             raise ValueError("This azure storage type is not valid. It should be blob or file.")
@@ -185,27 +216,147 @@ class Plugin(AbstractPlugin):
             key = self.storage_client.storage_accounts.list_keys(self.resource_group_name, parse_url.account).keys[
                 0].value
             if parse_url.file_type == 'blob':
-                bs = BlockBlobService(account_name=parse_url.account, account_key=key)
-                return bs.get_blob_to_path(parse_url.container_or_share_name, parse_url.file, dest_path)
+                bs = self._blob_service(parse_url.account, key)
+                get_properties = partial(bs.get_blob_properties, parse_url.container_or_share_name, parse_url.file)
+                get_to_path = partial(bs.get_blob_to_path, parse_url.container_or_share_name, parse_url.file,
+                                      dest_path)
             elif parse_url.file_type == 'file':
-                fs = FileService(account_name=parse_url.account, account_key=key)
-                return fs.get_file_to_path(parse_url.container_or_share_name, parse_url.path, parse_url.file, dest_path)
+                fs = self._file_service(parse_url.account, key)
+                get_properties = partial(fs.get_file_properties, parse_url.container_or_share_name, parse_url.path,
+                                         parse_url.file)
+                get_to_path = partial(fs.get_file_to_path, parse_url.container_or_share_name, parse_url.path,
+                                      parse_url.file, dest_path)
             else:
                 raise ValueError("This azure storage type is not valid. It should be blob or file.")
+            if self.config.compression:
+                # Compressed objects are expected: read the properties first rather than downloading them twice.
+                downloaded = get_properties()
+                if ORIGINAL_SIZE_METADATA not in downloaded.metadata:
+                    return get_to_path()
+            else:
+                # A single request for plain objects. The sdk does not decode the objects compressed by another
+                # writer, which are downloaded again below.
+                downloaded = get_to_path()
+                if ORIGINAL_SIZE_METADATA not in downloaded.metadata:
+                    return downloaded
+            # Uploaded compressed: streamed through a signed url, so that it can be decoded on the fly.
+            try:
+                self._download_url(self._sign_url(parse_url, key, timedelta(hours=1)), dest_path,
+                                   int(downloaded.metadata[ORIGINAL_SIZE_METADATA]), downloaded.properties.etag)
+            except Exception:
+                if not self.config.compression:
+                    # Do not leave the undecoded bytes written by the sdk behind.
+                    os.remove(dest_path)
+                raise
+            return downloaded
         else:
             parse_url = _parse_url(dest_path)
             key = self.storage_client.storage_accounts.list_keys(self.resource_group_name, parse_url.account).keys[
                 0].value
+            codec = get_codec(self.config.compression)
+            if codec is not None:
+                return self._upload_compressed(parse_url, key, source_path, codec)
             if parse_url.file_type == 'blob':
-                bs = BlockBlobService(account_name=parse_url.account, account_key=key)
+                bs = self._blob_service(parse_url.account, key)
                 return bs.create_blob_from_path(parse_url.container_or_share_name, parse_url.file, source_path)
             elif parse_url.file_type == 'file':
-                fs = FileService(account_name=parse_url.account, account_key=key)
+                fs = self._file_service(parse_url.account, key)
                 return fs.create_file_from_path(parse_url.container_or_share_name, parse_url.path, parse_url.file,
                                                 source_path)
             else:
                 raise ValueError("This azure storage type is not valid. It should be blob or file.")
 
+    def _upload_compressed(self, parse_url, key, source_path, codec):
+        """Upload a local file compressed with ``codec``, without writing the compressed data to disk."""
+        size = os.path.getsize(source_path)
+        metadata = {ORIGINAL_SIZE_METADATA: str(size)}
+        with open(source_path, 'rb') as f:
+            if parse_url.file_type == 'blob':
+                bs = self._blob_service(parse_url.account, key)
+                content_settings = BlobContentSettings(content_encoding=codec.name)
+                if size <= bs.MAX_BLOCK_SIZE:
+                    return bs.create_blob_from_bytes(parse_url.container_or_share_name, parse_url.file,
+                                                     b''.join(compress_frames(f, codec)),
+                                                     content_settings=content_settings, metadata=metadata)
+                with CompressingReader(f, codec) as reader:
+                    return bs.create_blob_from_stream(parse_url.container_or_share_name, parse_url.file, reader,
+                                                      content_settings=content_settings, metadata=metadata)
+            elif parse_url.file_type == 'file':
+                fs = self._file_service(parse_url.account, key)
+                content_settings = FileContentSettings(content_encoding=codec.name)
+                if size <= fs.MAX_RANGE_SIZE:
+                    return fs.create_file_from_bytes(parse_url.container_or_share_name, parse_url.path,
+                                                     parse_url.file, b''.join(compress_frames(f, codec)),
+                                                     content_settings=content_settings, metadata=metadata)
+                # The compressed size is unknown until the end: allocate the worst case and shrink the file after.
+                fs.create_file(parse_url.container_or_share_name, parse_url.path, parse_url.file,
+                               compressed_size_bound(size), content_settings=content_settings, metadata=metadata)
+                offset = 0
+                with CompressingReader(f, codec) as reader:
+                    for data in iter(lambda: reader.read(fs.MAX_RANGE_SIZE), b''):
+                        fs.update_range(parse_url.container_or_share_name, parse_url.path, parse_url.file, data,
+                                        offset, offset + len(data) - 1)
+                        offset += len(data)
+                fs.resize_file(parse_url.container_or_share_name, parse_url.path, parse_url.file, offset)
+                # Setting the properties again after resizing, which clears them.
+                return fs.set_file_properties(parse_url.container_or_share_name, parse_url.path, parse_url.file,
+                                              content_settings)
+            else:
+                raise ValueError("This azure storage type is not valid. It should be blob or file.")
+
+    def _download_url(self, url, dest_path, original_size, etag):
+        """Download a signed url to a local file, decoding its content encoding, and check it has ``original_size``
+        bytes.
+
+        Connection errors and server errors are retried. ``etag`` makes sure the object is the one whose
+        properties were read. The data is written to a temporary file next to ``dest_path``, which only replaces
+        ``dest_path`` once complete.
+        """
+        directory, name = os.path.split(os.path.abspath(dest_path))
+        part_path = os.path.join(directory, '.{}.{}.part'.format(name, uuid.uuid4().hex))
+        try:
+            for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+                try:
+                    self._download_url_once(url, part_path, original_size, etag)
+                    break
+                except (requests.RequestException, urllib3.exceptions.HTTPError, AzureHttpError) as e:
+                    if attempt == DOWNLOAD_ATTEMPTS or getattr(e, 'status_code', 500) < 500:
+                        raise
+                    self.logger.warning("Download of %s failed (%s), retrying.", dest_path, e)
+                    time.sleep(2 ** (attempt - 1))
+            os.replace(part_path, dest_path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+    def _download_url_once(self, url, dest_path, original_size, etag):
+        response = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT, headers={'If-Match': etag})
+        try:
+            if response.status_code >= 300:
+                raise AzureHttpError(response.reason, response.status_code)
+            # Read the raw bytes: requests would otherwise try to decode gzip itself.
+            chunks = response.raw.stream(DOWNLOAD_CHUNK_SIZE, decode_content=False)
+            codec = get_codec(response.headers.get('Content-Encoding'))
+            with open(dest_path, 'wb') as f:
+                if codec is None:
+                    written = 0
+                    for chunk in chunks:
+                        f.write(chunk)
+                        written += len(chunk)
+                else:
+                    try:
+                        written = decompress_chunks(chunks, codec, f)
+                    except codec.error as e:
+                        self.logger.error("Could not decode %s with %s: %s", dest_path, codec.name, e)
+                        raise OsmosisError
+            # Also catches a compressed object whose content encoding was cleared.
+            if written != original_size:
+                self.logger.error("Downloaded %s bytes to %s, expected %s", written, dest_path, original_size)
+                raise OsmosisError
+        finally:
+            response.close()
+
     def create_directory(self, remote_folder, container=None):
         if container:
             return self.create_container(remote_folder)
@@ -217,13 +368,13 @@ class Plugin(AbstractPlugin):
     def create_container(self, remote_folder):
         parse_url = _parse_url(remote_folder)
         key = self.storage_client.storage_accounts.list_keys(self.resource_group_name, parse_url.account).keys[0].value
-        bs = BlockBlobService(account_name=parse_url.account, account_key=key)
+        bs = self._blob_service(parse_url.account, key)
         return bs.create_container(container_name=remote_folder)
 
     def create_share_name(self, remote_folder):
         parse_url = _parse_url(remote_folder)
         key = self.storage_client.storage_accounts.list_keys(self.resource_group_name, parse_url.account).keys[0].value
-        fs = FileService(account_name=parse_url.account, account_key=key)
+        fs = self._file_service(parse_url.account, key)
         return fs.create_directory(share_name=parse_url.container_or_share_name, directory_name=parse_url.path)
 
     def retrieve_availability_proof(self):
@@ -0,0 +1,228 @@
+#  Copyright 2018 Ocean Protocol Foundation
+#  SPDX-License-Identifier: Apache-2.0
+
+"""Process-wide registry of Azure credentials and management clients.
+
+Building :class:`ServicePrincipalCredentials` does a synchronous AAD token request, so the plugins share one
+:class:`SharedCredentials` per (tenant, client_id, secret) instead of logging in on every instantiation, and one
+:class:`Session` of management clients per (tenant, client_id, subscription). Tokens are refreshed in the
+background before they expire. After a fork the management clients, which own pooled connections, are dropped
+and rebuilt lazily in the child, and the refresh timers, which do not survive a fork, are armed again.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from azure.common.credentials import ServicePrincipalCredentials
+from msrest.authentication import Authentication
+
+# Refresh the token this many seconds before it expires. ADAL refreshes on the request path 5 minutes before.
+REFRESH_MARGIN = 10 * 60
+# Delay before retrying a failed background refresh.
+RETRY_DELAY = 30
+
+logger = logging.getLogger(__name__)
+
+_credentials = {}
+_sessions = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+_fork_lock = threading.Lock()
+
+
+class SharedCredentials(Authentication):
+    """Credentials shared between clients, which swaps in a fresh token ahead of expiry.
+
+    The clients hold a reference to this object, so refreshing replaces the inner
+    :class:`ServicePrincipalCredentials` atomically without touching them.
+    """
+
+    def __init__(self, client_id, client_secret, tenant_id):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.tenant_id = tenant_id
+        self._credentials = self._login()
+        self._timer = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _login(self):
+        return ServicePrincipalCredentials(client_id=self.client_id, secret=self.client_secret,
+                                           tenant=self.tenant_id)
+
+    @property
+    def token(self):
+        return self._credentials.token
+
+    def signed_session(self, session=None):
+        return self._credentials.signed_session(session)
+
+    def refresh_session(self, session=None):
+        return self._credentials.refresh_session(session)
+
+    def refresh(self):
+        """Fetch a new token and reschedule the next refresh."""
+        if self._closed:
+            return
+        try:
+            self._credentials = self._login()
+        except Exception:
+            if not self._closed:
+                logger.warning('Background refresh of the Azure token failed, retrying in %s seconds.', RETRY_DELAY)
+                self._schedule(RETRY_DELAY)
+        else:
+            self.schedule_refresh()
+
+    def schedule_refresh(self):
+        """Arm a daemon timer that refreshes the token :data:`REFRESH_MARGIN` seconds before it expires.
+
+        Tokens living less than twice the margin are refreshed halfway through their lifetime instead, and never
+        sooner than :data:`RETRY_DELAY` seconds, so that short-lived tokens do not make the timer loop.
+        """
+        expires_on = self.token.get('expires_on')
+        if expires_on is None:
+            return
+        remaining = float(expires_on) - time.time()
+        self._schedule(max(remaining - REFRESH_MARGIN, remaining / 2, RETRY_DELAY))
+
+    def _schedule(self, delay):
+        with self._lock:
+            # A refresh running while the credentials are cancelled must not arm a new timer.
+            if self._closed:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self.refresh)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel_refresh(self):
+        """Stop refreshing the token for good, e.g. when the credentials are dropped from the registry."""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _after_fork(self):
+        # Timer threads do not survive a fork, and the lock may have been held by one of them.
+        self._lock = threading.Lock()
+        self._timer = None
+        self.schedule_refresh()
+
+
+class Session(object):
+    """Management clients shared by every plugin of a (tenant, client_id, subscription)."""
+
+    def __init__(self, credentials, subscription_id):
+        self.subscription_id = subscription_id
+        self.credentials = credentials
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, client_class):
+        """Return the shared instance of a management client class, e.g. :class:`ResourceManagementClient`."""
+        client = self._clients.get(client_class)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(client_class)
+                if client is None:
+                    client = client_class(self.credentials, self.subscription_id)
+                    self._clients[client_class] = client
+        return client
+
+    def _after_fork(self):
+        # The clients' connection pools must not be shared with the parent.
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def close(self):
+        self._clients = {}
+
+
+def get_credentials(client_id=None, client_secret=None, tenant_id=None):
+    """Return the shared :class:`SharedCredentials`, logging in on first use.
+
+    Missing arguments are read from the ``AZURE_CLIENT_ID``, ``AZURE_CLIENT_SECRET`` and ``AZURE_TENANT_ID``
+    environment variables.
+    """
+    client_id = os.getenv('AZURE_CLIENT_ID') if not client_id else client_id
+    client_secret = os.getenv('AZURE_CLIENT_SECRET') if not client_secret else client_secret
+    tenant_id = os.getenv('AZURE_TENANT_ID') if not tenant_id else tenant_id
+    key = (tenant_id, client_id, client_secret)
+
+    _check_fork()
+    credentials = _credentials.get(key)
+    if credentials is None:
+        with _lock:
+            credentials = _credentials.get(key)
+            if credentials is None:
+                # A rotated secret replaces the credentials of the service principal.
+                for other in [k for k in _credentials if k[:2] == key[:2]]:
+                    _credentials.pop(other).cancel_refresh()
+                credentials = SharedCredentials(client_id, client_secret, tenant_id)
+                credentials.schedule_refresh()
+                _credentials[key] = credentials
+    return credentials
+
+
+def get_session(client_id=None, client_secret=None, tenant_id=None, subscription_id=None):
+    """Return the shared :class:`Session`, creating it on first use.
+
+    Missing arguments are read from the ``AZURE_CLIENT_ID``, ``AZURE_CLIENT_SECRET``, ``AZURE_TENANT_ID`` and
+    ``AZURE_SUBSCRIPTION_ID`` environment variables. Sessions of the same service principal share its
+    credentials, so using several subscriptions logs in and refreshes the token only once.
+    """
+    credentials = get_credentials(client_id, client_secret, tenant_id)
+    subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID') if not subscription_id else subscription_id
+    key = (credentials.tenant_id, credentials.client_id, subscription_id)
+
+    session = _sessions.get(key)
+    if session is None or session.credentials is not credentials:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None or session.credentials is not credentials:
+                if session is not None:
+                    session.close()
+                session = Session(credentials, subscription_id)
+                _sessions[key] = session
+    return session
+
+
+def clear_sessions():
+    """Drop every shared session and credentials, e.g. after rotating credentials."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        for credentials in _credentials.values():
+            credentials.cancel_refresh()
+        _credentials.clear()
+
+
+def _after_fork_in_child():
+    global _lock, _pid
+    # The lock may have been held by another thread of the parent when forking.
+    _lock = threading.Lock()
+    _pid = os.getpid()
+    for credentials in _credentials.values():
+        credentials._after_fork()
+    for session in _sessions.values():
+        session._after_fork()
+
+
+def _check_fork():
+    # Fallback for Python 3.6, which has no os.register_at_fork. _fork_lock is only taken in a child that has
+    # not reset yet, so it is not held when the parent forks, and it makes sure a single thread resets the
+    # registry and arms the refresh timers.
+    if _pid == os.getpid():
+        return
+    with _fork_lock:
+        if _pid != os.getpid():
+            _after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -20,12 +20,17 @@ install_requirements = [
     'coloredlogs',
     'azure==4.0.0',
     'osmosis-driver-interface>=0.1.0',
+    'requests',
+    'urllib3',
 ]
 
+# Optional, to compress the uploads with zstd:
+zstd_requirements = ['zstandard>=0.15', ]
+
 # Required to run setup.py:
 setup_requirements = ['pytest-runner', ]
 
-test_requirements = [
+test_requirements = zstd_requirements + [
     'codacy-coverage',
     'coverage',
     'pylint',
@@ -55,6 +60,7 @@ setup(
     ],
     description="💧 Osmosis Azure Data Driver Implementation",
     extras_require={
+        'zstd': zstd_requirements,
         'test': test_requirements,
         'dev': dev_requirements + test_requirements,
     },
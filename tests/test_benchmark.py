@@ -0,0 +1,61 @@
+#  Copyright 2018 Ocean Protocol Foundation
+#  SPDX-License-Identifier: Apache-2.0
+
+import os
+
+from benchmarks.bench_data_plugin import ACCOUNT_NAME, DEV_ACCOUNT_KEY, BenchmarkPlugin, compare, \
+    parse_size, percentile, run, to_json
+from benchmarks.fake_storage import FakeStorageServer
+
+
+def test_round_trip_on_fake_storage(tmpdir):
+    source = str(tmpdir.join('source'))
+    target = str(tmpdir.join('target'))
+    with open(source, 'wb') as f:
+        f.write(os.urandom(5 * 1024 * 1024))
+    with FakeStorageServer() as server:
+        osmo = BenchmarkPlugin({'azure.blob.endpoint': server.blob_endpoint,
+                                'azure.file.endpoint': server.file_endpoint}, DEV_ACCOUNT_KEY)
+        osmo._blob_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY).create_container('bench')
+        osmo._file_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY).create_share('bench')
+        for service in ('blob', 'file'):
+            url = 'https://{}.{}.core.windows.net/bench/data'.format(ACCOUNT_NAME, service)
+            osmo.upload(source, url)
+            osmo.download(url, target)
+            assert open(target, 'rb').read() == open(source, 'rb').read()
+            assert osmo.list('bench', service == 'blob', ACCOUNT_NAME) == ['data']
+            assert osmo.generate_url(url).startswith(getattr(server, service + '_endpoint'))
+            osmo.delete(url)
+            assert osmo.list('bench', service == 'blob', ACCOUNT_NAME) == []
+
+
+def test_run_reports_every_operation():
+    with FakeStorageServer(latency=0.001) as server:
+        results = run([parse_size('1KB')], [3], config={'azure.blob.endpoint': server.blob_endpoint,
+                                                        'azure.file.endpoint': server.file_endpoint},
+                      list_iterations=2)
+    assert [r.name for r in results if r.service == 'blob'] == [
+        'blob.upload.1KBx3', 'blob.download.1KBx3', 'blob.list.1KBx3', 'blob.generate_url.1KBx3',
+        'blob.delete.1KBx3']
+    assert all(r.p50_ms >= 1 for r in results if r.operation != 'generate_url')
+    report = to_json(results)
+    lines, regressions = compare(report, report)
+    assert len(lines) == len(results) + 1
+    assert regressions == []
+
+    slower = to_json([r._replace(mb_per_sec=r.mb_per_sec / 2) for r in results])
+    slower['meta']['peak_rss_mb'] = report['meta']['peak_rss_mb'] * 2
+    lines, regressions = compare(slower, report)
+    assert 'blob.download.1KBx3' in regressions and 'peak_rss_mb' in regressions
+    assert 'blob.list.1KBx3' not in regressions
+
+    compressed = to_json(results, compression='zstd')
+    lines, regressions = compare(compressed, report)
+    assert lines[0] == "WARNING: compression differs, baseline None, current 'zstd'"
+    assert len(lines) == len(results) + 2
+
+
+def test_percentile():
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([], 99) == 0.0
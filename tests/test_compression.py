@@ -0,0 +1,163 @@
+#  Copyright 2018 Ocean Protocol Foundation
+#  SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import io
+
+import pytest
+import requests
+from azure.storage.blob import BlockBlobService
+from azure.storage.blob.models import Blob
+from azure.storage.file import ContentSettings, FileService
+from azure.storage.file.models import File
+from osmosis_driver_interface.exceptions import OsmosisError
+
+from benchmarks.bench_data_plugin import ACCOUNT_NAME, DEV_ACCOUNT_KEY, BenchmarkPlugin
+from benchmarks.fake_storage import FakeStorageServer
+from osmosis_azure_driver import data_plugin
+from osmosis_azure_driver.compression import CompressingReader, compressed_size_bound, decompress_chunks, \
+    get_codec
+
+DATA = b''.join(b'%d,osmosis,%d,azure\n' % (i, i * 7) for i in range(400000))
+
+
+@pytest.mark.parametrize('name', ['gzip', 'zstd'])
+def test_frames_round_trip(name):
+    codec = get_codec(name)
+    compressed = CompressingReader(io.BytesIO(DATA), codec, frame_size=64 * 1024, workers=4).read()
+    assert len(compressed) < len(DATA) / 4
+    output = io.BytesIO()
+    chunks = [compressed[i:i + 1000] for i in range(0, len(compressed), 1000)]
+    assert decompress_chunks(chunks, codec, output) == len(DATA)
+    assert output.getvalue() == DATA
+
+
+def test_gzip_frames_are_standard():
+    compressed = CompressingReader(io.BytesIO(DATA), get_codec('gzip'), frame_size=64 * 1024).read()
+    assert gzip.decompress(compressed) == DATA
+
+
+def test_empty_input():
+    codec = get_codec('gzip')
+    compressed = CompressingReader(io.BytesIO(b''), codec).read()
+    assert gzip.decompress(compressed) == b''
+
+
+def test_codecs():
+    assert get_codec(None) is None
+    with pytest.raises(ValueError):
+        get_codec('lzma')
+    assert compressed_size_bound(len(DATA)) > len(DATA)
+
+
+@pytest.mark.parametrize('name', ['gzip', 'zstd'])
+def test_compressed_copy(tmpdir, name):
+    with FakeStorageServer() as server:
+        osmo = BenchmarkPlugin({'azure.blob.endpoint': server.blob_endpoint,
+                                'azure.file.endpoint': server.file_endpoint,
+                                'azure.compression': name}, DEV_ACCOUNT_KEY)
+        bs = osmo._blob_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY)
+        fs = osmo._file_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY)
+        bs.create_container('bench')
+        fs.create_share('bench')
+        for size in (1000, len(DATA)):
+            source = str(tmpdir.join('source'))
+            target = str(tmpdir.join('target'))
+            with open(source, 'wb') as f:
+                f.write(DATA[:size])
+            for service in ('blob', 'file'):
+                url = 'https://{}.{}.core.windows.net/bench/data.csv'.format(ACCOUNT_NAME, service)
+                osmo.upload(source, url)
+                downloaded = osmo.download(url, target)
+                assert isinstance(downloaded, Blob if service == 'blob' else File)
+                assert downloaded.metadata == {'osmosis_original_size': str(size)}
+                assert open(target, 'rb').read() == DATA[:size]
+            blob = bs.get_blob_properties('bench', 'data.csv')
+            assert blob.properties.content_settings.content_encoding == name
+            assert blob.metadata == {'osmosis_original_size': str(size)}
+            file = fs.get_file_properties('bench', None, 'data.csv')
+            assert file.properties.content_settings.content_encoding == name
+            assert file.properties.content_length < size
+
+
+def test_uncompressed_copy(tmpdir, monkeypatch):
+    def no_properties(*args):
+        raise AssertionError('without compression configured, downloads are a single sdk request')
+
+    monkeypatch.setattr(BlockBlobService, 'get_blob_properties', no_properties)
+    monkeypatch.setattr(FileService, 'get_file_properties', no_properties)
+    with FakeStorageServer() as server:
+        config = {'azure.blob.endpoint': server.blob_endpoint, 'azure.file.endpoint': server.file_endpoint}
+        osmo = BenchmarkPlugin(config, DEV_ACCOUNT_KEY)
+        compressing = BenchmarkPlugin(dict(config, **{'azure.compression': 'gzip'}), DEV_ACCOUNT_KEY)
+        osmo._blob_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY).create_container('bench')
+        osmo._file_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY).create_share('bench')
+        source = str(tmpdir.join('source'))
+        target = str(tmpdir.join('target'))
+        with open(source, 'wb') as f:
+            f.write(DATA)
+        for service in ('blob', 'file'):
+            url = 'https://{}.{}.core.windows.net/bench/data.csv'.format(ACCOUNT_NAME, service)
+            osmo.upload(source, url)
+            downloaded = osmo.download(url, target)
+            assert isinstance(downloaded, Blob if service == 'blob' else File)
+            assert downloaded.properties.content_settings.content_encoding is None
+            assert open(target, 'rb').read() == DATA
+            # Objects compressed by another writer are still decoded.
+            compressing.upload(source, url)
+            downloaded = osmo.download(url, target)
+            assert downloaded.properties.content_settings.content_encoding == 'gzip'
+            assert open(target, 'rb').read() == DATA
+
+
+def test_compressed_download_is_retried(tmpdir, monkeypatch):
+    get = requests.get
+    calls = []
+
+    def flaky_get(url, **kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise requests.ConnectionError('reset')
+        return get(url, **kwargs)
+
+    monkeypatch.setattr(data_plugin.requests, 'get', flaky_get)
+    monkeypatch.setattr(data_plugin.time, 'sleep', lambda delay: None)
+    with FakeStorageServer() as server:
+        osmo = BenchmarkPlugin({'azure.blob.endpoint': server.blob_endpoint,
+                                'azure.compression': 'gzip'}, DEV_ACCOUNT_KEY)
+        osmo._blob_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY).create_container('bench')
+        source = str(tmpdir.join('source'))
+        target = str(tmpdir.join('target'))
+        with open(source, 'wb') as f:
+            f.write(DATA)
+        url = 'https://{}.blob.core.windows.net/bench/data.csv'.format(ACCOUNT_NAME)
+        osmo.upload(source, url)
+        osmo.download(url, target)
+        assert open(target, 'rb').read() == DATA
+        assert len(calls) == 2
+        assert all(call['timeout'] == data_plugin.DOWNLOAD_TIMEOUT for call in calls)
+
+
+@pytest.mark.parametrize('damage, reader_compression', [('cleared_encoding', None), ('cleared_encoding', 'gzip'),
+                                                        ('corrupted_data', 'gzip')])
+def test_bad_download_is_detected(tmpdir, damage, reader_compression):
+    with FakeStorageServer() as server:
+        writer = BenchmarkPlugin({'azure.file.endpoint': server.file_endpoint,
+                                  'azure.compression': 'gzip'}, DEV_ACCOUNT_KEY)
+        reader = BenchmarkPlugin({'azure.file.endpoint': server.file_endpoint,
+                                  'azure.compression': reader_compression}, DEV_ACCOUNT_KEY)
+        fs = writer._file_service(ACCOUNT_NAME, DEV_ACCOUNT_KEY)
+        fs.create_share('bench')
+        source = str(tmpdir.join('source'))
+        with open(source, 'wb') as f:
+            f.write(DATA)
+        url = 'https://{}.file.core.windows.net/bench/data.csv'.format(ACCOUNT_NAME)
+        writer.upload(source, url)
+        if damage == 'cleared_encoding':
+            fs.set_file_properties('bench', None, 'data.csv', ContentSettings())
+        else:
+            fs.update_range('bench', None, 'data.csv', b'x' * 100, 1000, 1099)
+        with pytest.raises(OsmosisError):
+            reader.download(url, str(tmpdir.join('target')))
+        # Neither a partial nor an undecoded file is left behind.
+        assert tmpdir.listdir() == [tmpdir.join('source')]
@@ -0,0 +1,135 @@
+#  Copyright 2018 Ocean Protocol Foundation
+#  SPDX-License-Identifier: Apache-2.0
+
+import os
+import threading
+import time
+
+import pytest
+
+from azure.mgmt.resource import ResourceManagementClient
+from azure.mgmt.storage import StorageManagementClient
+
+from osmosis_azure_driver import session
+
+
+class FakeCredentials(object):
+    logins = 0
+    lifetime = 3600
+
+    def __init__(self, client_id, secret, tenant):
+        FakeCredentials.logins += 1
+        self.token = {'access_token': str(FakeCredentials.logins), 'expires_on': time.time() + self.lifetime}
+
+
+def _setup(monkeypatch):
+    monkeypatch.setattr(session, 'ServicePrincipalCredentials', FakeCredentials)
+    FakeCredentials.logins = 0
+    session.clear_sessions()
+
+
+def test_session_is_shared(monkeypatch):
+    _setup(monkeypatch)
+    first = session.get_session('client', 'secret', 'tenant', 'subscription')
+    assert session.get_session('client', 'secret', 'tenant', 'subscription') is first
+    assert first.client(ResourceManagementClient) is first.client(ResourceManagementClient)
+    assert first.client(StorageManagementClient).config.credentials is first.credentials
+    other = session.get_session('client', 'secret', 'tenant', 'other')
+    assert other is not first
+    assert other.credentials is first.credentials
+    assert other.client(ResourceManagementClient) is not first.client(ResourceManagementClient)
+    assert FakeCredentials.logins == 1
+    session.clear_sessions()
+
+
+def test_secret_change_logs_in_again(monkeypatch):
+    _setup(monkeypatch)
+    first = session.get_session('client', 'secret', 'tenant', 'subscription')
+    second = session.get_session('client', 'rotated', 'tenant', 'subscription')
+    assert second is not first
+    assert second.credentials is not first.credentials
+    assert first.credentials._timer is None
+    assert FakeCredentials.logins == 2
+    session.clear_sessions()
+
+
+def test_token_is_refreshed_before_expiry(monkeypatch):
+    _setup(monkeypatch)
+    monkeypatch.setattr(FakeCredentials, 'lifetime', 0.2)
+    monkeypatch.setattr(session, 'RETRY_DELAY', 0.05)
+    shared = session.get_session('client', 'secret', 'tenant', 'subscription')
+    client = shared.client(ResourceManagementClient)
+    time.sleep(0.5)
+    assert FakeCredentials.logins >= 2
+    assert client.config.credentials.token['access_token'] != '1'
+    session.clear_sessions()
+
+
+
+def test_short_lived_token_is_refreshed_halfway(monkeypatch):
+    _setup(monkeypatch)
+    monkeypatch.setattr(FakeCredentials, 'lifetime', 300)
+    credentials = session.get_credentials('client', 'secret', 'tenant')
+    assert 149 < credentials._timer.interval <= 150
+    monkeypatch.setattr(FakeCredentials, 'lifetime', 10)
+    credentials.refresh()
+    assert credentials._timer.interval == session.RETRY_DELAY
+    session.clear_sessions()
+
+def test_clients_are_rebuilt_after_fork(monkeypatch):
+    _setup(monkeypatch)
+    shared = session.get_session('client', 'secret', 'tenant', 'subscription')
+    client = shared.client(ResourceManagementClient)
+    monkeypatch.setattr(session, '_pid', os.getpid() + 1)
+    assert session.get_session('client', 'secret', 'tenant', 'subscription') is shared
+    assert shared.client(ResourceManagementClient) is not client
+    assert FakeCredentials.logins == 1
+    session.clear_sessions()
+
+
+
+def test_cancel_during_refresh_does_not_arm_a_timer(monkeypatch):
+    _setup(monkeypatch)
+    blocked, release = threading.Event(), threading.Event()
+
+    class BlockingCredentials(FakeCredentials):
+        def __init__(self, client_id, secret, tenant):
+            if threading.current_thread().name == 'refresh':
+                blocked.set()
+                release.wait(5)
+            super().__init__(client_id, secret, tenant)
+
+    monkeypatch.setattr(session, 'ServicePrincipalCredentials', BlockingCredentials)
+    credentials = session.get_credentials('client', 'secret', 'tenant')
+    refresh = threading.Thread(target=credentials.refresh, name='refresh')
+    refresh.start()
+    assert blocked.wait(5)
+    # Rotating the secret cancels the credentials while their refresh is blocked in the login.
+    session.get_credentials('client', 'rotated', 'tenant')
+    release.set()
+    refresh.join(5)
+    assert credentials._timer is None
+    session.clear_sessions()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_refresh_is_armed_again_in_forked_child(monkeypatch):
+    _setup(monkeypatch)
+    shared = session.get_session('client', 'secret', 'tenant', 'subscription')
+    client = shared.client(ResourceManagementClient)
+    pid = os.fork()
+    if pid == 0:
+        # Report through the exit status, the child must not run the rest of pytest.
+        try:
+            timer = shared.credentials._timer
+            ok = (timer is not None and timer.is_alive() and
+                  session.get_session('client', 'secret', 'tenant', 'subscription') is shared and
+                  shared.client(ResourceManagementClient) is not client and
+                  FakeCredentials.logins == 1)
+        except Exception:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert shared.client(ResourceManagementClient) is client
+    session.clear_sessions()